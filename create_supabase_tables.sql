@@ -21,24 +21,65 @@ CREATE TABLE IF NOT EXISTS comments (
     story_id INTEGER NOT NULL REFERENCES stories(id),
     story_text TEXT,
     structured_data JSONB,
-    processed_status VARCHAR(50) DEFAULT 'pending' CHECK (processed_status IN ('pending', 'processing', 'completed', 'failed')),
+    processed_status VARCHAR(50) DEFAULT 'pending' CHECK (processed_status IN ('pending', 'processing', 'completed', 'failed', 'error', 'skipped')),
     created_time TIMESTAMP,
     fetched_time TIMESTAMP DEFAULT NOW()
 );
 
+-- Contact email copied out of structured_data for filtering
+ALTER TABLE comments ADD COLUMN IF NOT EXISTS email TEXT;
+
+-- Widen the status CHECK on existing tables too - CREATE TABLE IF NOT EXISTS leaves it as-is
+ALTER TABLE comments DROP CONSTRAINT IF EXISTS comments_processed_status_check;
+ALTER TABLE comments ADD CONSTRAINT comments_processed_status_check
+    CHECK (processed_status IN ('pending', 'processing', 'completed', 'failed', 'error', 'skipped'));
+
+-- Claude extraction results keyed by a hash of the cleaned posting text,
+-- so reposts and re-runs don't pay for another Claude call
+CREATE TABLE IF NOT EXISTS extraction_cache (
+    text_hash CHAR(32) PRIMARY KEY,  -- blake2b (16 byte digest), hex encoded
+    structured_data JSONB NOT NULL,
+    created_at TIMESTAMP DEFAULT NOW()
+);
+
 -- Create indexes for better performance
 CREATE INDEX IF NOT EXISTS idx_stories_hn_id ON stories(hn_id);
 CREATE INDEX IF NOT EXISTS idx_stories_month ON stories(month);  -- Fast month-based queries
 CREATE INDEX IF NOT EXISTS idx_comments_hn_id ON comments(hn_id);
 CREATE INDEX IF NOT EXISTS idx_comments_story_id ON comments(story_id);
 CREATE INDEX IF NOT EXISTS idx_comments_processed_status ON comments(processed_status);
+CREATE INDEX IF NOT EXISTS idx_comments_pending_id ON comments(id) WHERE processed_status = 'pending';  -- Pending queue paging
 
 -- Enable Row Level Security (RLS)
 ALTER TABLE stories ENABLE ROW LEVEL SECURITY;
 ALTER TABLE comments ENABLE ROW LEVEL SECURITY;
+ALTER TABLE extraction_cache ENABLE ROW LEVEL SECURITY;
 
 -- Create policies for public access (adjust as needed)
 CREATE POLICY "Allow public read access on stories" ON stories FOR SELECT USING (true);
 CREATE POLICY "Allow public insert access on stories" ON stories FOR INSERT WITH CHECK (true);
+CREATE POLICY "Allow public update access on stories" ON stories FOR UPDATE USING (true);  -- Needed for story upserts
 CREATE POLICY "Allow public read access on comments" ON comments FOR SELECT USING (true);
-CREATE POLICY "Allow public insert access on comments" ON comments FOR INSERT WITH CHECK (true);
\ No newline at end of file
+CREATE POLICY "Allow public insert access on comments" ON comments FOR INSERT WITH CHECK (true);
+CREATE POLICY "Allow public read access on extraction_cache" ON extraction_cache FOR SELECT USING (true);
+CREATE POLICY "Allow public insert access on extraction_cache" ON extraction_cache FOR INSERT WITH CHECK (true);
+
+-- Apply many per-row comment updates in one round trip (HNDatabase.batch_update_comment_status)
+-- updates: [{"hn_id": 1, "processed_status": "completed", "structured_data": {...}, "email": "..."}]
+CREATE OR REPLACE FUNCTION bulk_update_comment_status(updates JSONB)
+RETURNS INTEGER
+LANGUAGE sql
+AS $$
+    WITH updated AS (
+        UPDATE comments AS c
+        SET processed_status = v.processed_status,
+            structured_data = v.structured_data,
+            -- Keep an existing email unless new data provides one; clear it on failure
+            email = CASE WHEN v.structured_data IS NULL THEN NULL ELSE COALESCE(v.email, c.email) END
+        FROM jsonb_to_recordset(updates)
+            AS v(hn_id INTEGER, processed_status VARCHAR(50), structured_data JSONB, email TEXT)
+        WHERE c.hn_id = v.hn_id
+        RETURNING c.hn_id
+    )
+    SELECT COUNT(*)::INTEGER FROM updated;
+$$;
@@ -1,8 +1,10 @@
 import logging
 import select
-from supabase import create_client, Client
-from typing import List, Dict, Any, Optional
+import httpx
+from supabase import create_client, Client, ClientOptions
+from typing import List, Dict, Any, Iterator, Optional, Tuple
 import os
+from itertools import islice
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
@@ -12,9 +14,23 @@ class DatabaseError(Exception):
     pass
 
 
+class PartialUpdateError(DatabaseError):
+    """Raised when some chunks of a bulk update failed - failed_hn_ids lists the rows not written"""
+
+    def __init__(self, message: str, failed_hn_ids: List[int]):
+        super().__init__(message)
+        self.failed_hn_ids = failed_hn_ids
+
+
 class HNDatabase:
     """Database layer for HN Newsletter backend"""
 
+    IN_FILTER_CHUNK = 200  # Max ids per `in.(...)` filter - keeps request URLs bounded
+
+    # Column projections - avoid shipping large blobs the caller doesn't read
+    JOB_COLUMNS = "id, hn_id, story_id, email, structured_data, created_time"  # No raw story_text
+    COMMENT_COLUMNS = "id, hn_id, story_id, story_text, processed_status, created_time"  # No structured_data
+
     def __init__(self):
         """Initialize Supabase connection"""
         supabase_url = os.getenv("SUPABASE_URL")
@@ -24,10 +40,30 @@ class HNDatabase:
             raise DatabaseError("SUPABASE_URL and SUPABASE_ANON_KEY must be set in environment")
 
         try:
-            self.client: Client = create_client(supabase_url, supabase_key)
+            self.client: Client = create_client(
+                supabase_url,
+                supabase_key,
+                options=ClientOptions(httpx_client=self._create_http_client())
+            )
         except Exception as e:
             raise DatabaseError(f"Failed to connect to Supabase: {str(e)}")
 
+        # Rows per insert request - keeps payloads under PostgREST limits
+        self.insert_chunk_size = int(os.getenv("HN_INSERT_CHUNK", "1000"))
+
+    @staticmethod
+    def _create_http_client() -> httpx.Client:
+        """Build the httpx client Supabase uses for PostgREST - a small keep-alive pool"""
+        # 3 pooled + 2 overflow connections, recycled after 30 minutes idle -
+        # stays well under Supabase's pooler connection cap. Passed through
+        # ClientOptions so it survives the client rebuilding postgrest on auth events
+        return httpx.Client(
+            timeout=10.0,
+            follow_redirects=True,
+            http2=True,
+            limits=httpx.Limits(max_connections=5, max_keepalive_connections=3, keepalive_expiry=1800)
+        )
+
     # Story operations
     def create_story(self, hn_id: int, title: str = None, kids_count: int = 0, month: str = "month",
                     descendants_count: int = 0, score: int = 0, created_time: datetime = None) -> Dict[str, Any]:
@@ -46,11 +82,11 @@ class HNDatabase:
             logger.info(f'what are we storing {story_data}')
 
 
-            response = self.client.table('stories').select('*').eq("hn_id", hn_id).execute()
-            if response.data:
-                logger.info(f"Story {hn_id} already exists, returning existing record")
-                return response.data[0]
-            response = self.client.table('stories').insert(story_data).execute()
+            response = self.client.table('stories').upsert(
+                story_data,
+                on_conflict='hn_id',           # Unique HN id - refreshes an existing story
+                ignore_duplicates=False        # Return the row even when it already exists
+            ).execute()
             if response.data:
                 return response.data[0]
             raise DatabaseError("Failed to create story")
@@ -94,18 +130,21 @@ class HNDatabase:
 
     def get_completed_jobs(self,month) ->  List[Dict[str, Any]]:
         try :
-            # Get the single story for this month
-            story_response = self.client.table("stories").select("id").eq("month", month).execute()
-
-            if not story_response.data or len(story_response.data) == 0:
+            # Get the single story for this month with its completed comments embedded
+            # (one request - PostgREST joins via the comments.story_id foreign key)
+            response = (
+                self.client.table("stories")
+                .select(f"id, comments({self.JOB_COLUMNS})")
+                .eq("month", month)
+                .eq("comments.processed_status", "completed")
+                .limit(1)
+                .execute()
+            )
+
+            if not response.data:
                 return []  # No story found for this month
 
-            story_id = story_response.data[0]["id"]  # Get the first (and only) story's ID
-
-            # Get comments for that story
-            response = self.client.table("comments").select("*").eq("processed_status", "completed").eq("story_id", story_id).execute()
-
-            return response.data if response.data else []
+            return response.data[0].get("comments") or []
         except Exception as e:
             raise DatabaseError(f"Error fetching comments: {str(e)}")
 
@@ -114,7 +153,7 @@ class HNDatabase:
     def get_comments_by_story_id(self, story_id: int) -> List[Dict[str, Any]]:
         """Get all comments for a story"""
         try:
-            response = self.client.table("comments").select("*").eq("story_id", story_id).execute()
+            response = self.client.table("comments").select(self.COMMENT_COLUMNS).eq("story_id", story_id).execute()
             return response.data if response.data else []
         except Exception as e:
             raise DatabaseError(f"Error fetching comments: {str(e)}")
@@ -123,50 +162,223 @@ class HNDatabase:
     def get_comments_by_hn_id(self, hn_id: int) -> List[Dict[str, Any]]:
         """Get comment by an id"""
         try:
-            response = self.client.table("comments").select("*").eq("hn_id", hn_id).execute()
+            response = self.client.table("comments").select(self.COMMENT_COLUMNS).eq("hn_id", hn_id).execute()
             return response.data if response.data else []
         except Exception as e:
             raise DatabaseError(f"Error fetching comments: {str(e)}")
 
-    def get_pending_comments(self, limit: int = 1000) -> List[Dict[str, Any]]:
-        """Get comments with pending processing status"""
+    def get_comment_by_hn_id(self, hn_id: int) -> Optional[Dict[str, Any]]:
+        """Get a single comment by HN ID, or None if not found"""
         try:
-            response = self.client.table("comments").select("*").eq("processed_status", "pending").limit(limit).execute()
-            return response.data if response.data else []
+            response = self.client.table("comments").select(self.COMMENT_COLUMNS).eq("hn_id", hn_id).limit(1).execute()
+            return response.data[0] if response.data else None
         except Exception as e:
-            raise DatabaseError(f"Error fetching comments: {str(e)}")
+            raise DatabaseError(f"Error fetching comment: {str(e)}")
+
+    def get_pending_comments(self, limit: int = 1000) -> List[Dict[str, Any]]:
+        """Get up to `limit` comments with pending processing status, in id order"""
+        # Thin wrapper over the keyset pager - offset paging skips rows as they leave 'pending'
+        return list(islice(self.iter_pending_comments(columns=("*",), chunk_size=min(limit, 500)), limit))
+
+    def iter_pending_comments(self, columns: Tuple[str, ...] = ("hn_id", "story_text"),
+                              chunk_size: int = 500) -> Iterator[Dict[str, Any]]:
+        """
+        Stream pending comments page by page, selecting only the given columns
+
+        Pages are keyed on id (id > last seen id) rather than offset, so comments
+        updated out of 'pending' while iterating don't shift later pages.
+
+        Args:
+            columns: Columns to return for each comment
+            chunk_size: Rows fetched per request
+
+        Yields:
+            Pending comment records in id order
+        """
+        select_columns = ", ".join(dict.fromkeys(("id", *columns)))  # id drives the paging
+        last_id = 0
+
+        while True:
+            try:
+                response = (
+                    self.client.table("comments")
+                    .select(select_columns)
+                    .eq("processed_status", "pending")
+                    .gt("id", last_id)
+                    .order("id")  # Served by idx_comments_pending_id
+                    .limit(chunk_size)
+                    .execute()
+                )
+            except Exception as e:
+                raise DatabaseError(f"Error fetching comments: {str(e)}")
+
+            rows = response.data or []
+            yield from rows
+
+            if len(rows) < chunk_size:
+                return
+            last_id = rows[-1]["id"]
+
+    def _status_update_data(self, status: str, structured_data: Dict = None) -> Dict[str, Any]:
+        """Build the column updates for a comment status change"""
+        update_data = {"processed_status": status} 
+
+        if structured_data is not None:
+            update_data["structured_data"] = structured_data
+            if structured_data.get("email") is not None:
+                update_data["email"] = structured_data["email"]
+        else:
+            # Explicitly clear when processing fails
+            update_data["structured_data"] = None
+            update_data["email"] = None
+
+        return update_data
 
     def update_comment_status(self, comment_id: int, status: str, structured_data: Dict = None) -> bool:
         """Update comment processing status and structured data"""
         try:
-            update_data = {"processed_status": status} 
-
-            if structured_data is not None:
-                update_data["structured_data"] = structured_data
-                if structured_data.get("email") is not None:
-                    update_data["email"] = structured_data["email"]
-            else:
-                # Explicitly clear when processing fails
-                update_data["structured_data"] = None
-                update_data["email"] = None
+            update_data = self._status_update_data(status, structured_data)
 
             response = self.client.table("comments").update(update_data).eq("hn_id", comment_id).execute()
             return len(response.data) > 0
         except Exception as e:
             raise DatabaseError(f"Error updating comment status: {str(e)}")
 
-    def batch_create_comments(self, comments_data: List[Dict[str, Any]]) -> int:
-        """Bulk insert comments for efficiency"""
+    def batch_update_comment_status(self, updates: List[Dict[str, Any]]) -> int:
+        """
+        Apply many comment status changes with as few requests as possible
+
+        Each chunk is its own request, so a failed chunk doesn't stop the rest
+        from being written.
+
+        Args:
+            updates: Dicts with "hn_id", "status" and optional "structured_data"
+
+        Returns:
+            Number of comments updated
+
+        Raises:
+            PartialUpdateError: If any chunk failed, listing the hn_ids it held
+        """
+        if not updates:
+            return 0
+
+        updated_count = 0
+        failed_hn_ids: List[int] = []
+        chunk_errors: List[str] = []
+        status_groups: Dict[str, List[int]] = {}
+        row_updates: List[Dict[str, Any]] = []
+
+        for update in updates:
+            structured_data = update.get("structured_data")
+            if structured_data is None:
+                # Same payload for every row with this status - grouped below
+                status_groups.setdefault(update["status"], []).append(update["hn_id"])
+                continue
+
+            # Per-row extracted data can't share a payload - sent through the bulk RPC
+            row_updates.append({
+                "hn_id": update["hn_id"],
+                **self._status_update_data(update["status"], structured_data)
+            })
+
+        # UPDATE ... FROM jsonb_to_recordset(...) - see create_supabase_tables.sql
+        for i in range(0, len(row_updates), self.insert_chunk_size):
+            chunk = row_updates[i:i + self.insert_chunk_size]
+            try:
+                response = self.client.rpc("bulk_update_comment_status", {"updates": chunk}).execute()
+                updated_count += response.data or 0
+            except Exception as e:
+                failed_hn_ids.extend(row["hn_id"] for row in chunk)
+                chunk_errors.append(str(e))
+
+        # One UPDATE ... WHERE hn_id IN (...) per status, chunked to keep the URL short
+        for status, hn_ids in status_groups.items():
+            update_data = self._status_update_data(status)
+            for i in range(0, len(hn_ids), self.IN_FILTER_CHUNK):
+                chunk_ids = hn_ids[i:i + self.IN_FILTER_CHUNK]
+                try:
+                    response = (
+                        self.client.table("comments")
+                        .update(update_data)
+                        .in_("hn_id", chunk_ids)
+                        .execute()
+                    )
+                    updated_count += len(response.data) if response.data else 0
+                except Exception as e:
+                    failed_hn_ids.extend(chunk_ids)
+                    chunk_errors.append(str(e))
+
+        if failed_hn_ids:
+            raise PartialUpdateError(
+                f"Error batch updating comment status for {len(failed_hn_ids)} of {len(updates)} "
+                f"comments: {'; '.join(chunk_errors)}",
+                failed_hn_ids
+            )
+
+        return updated_count
+
+    def batch_create_comments(self, comments_data: List[Dict[str, Any]], chunk_size: Optional[int] = None) -> int:
+        """Bulk insert comments for efficiency, in chunks of chunk_size rows (existing hn_ids are skipped)"""
         try:
             if not comments_data:
                 logger.info("No comments to insert - returning 0")
                 return 0
 
-            response = self.client.table('comments').insert(comments_data).execute()
+            # Drop repeated hn_ids within the batch - last one wins
+            comments_data = list({comment["hn_id"]: comment for comment in comments_data}.values())
+
+            chunk_size = chunk_size or self.insert_chunk_size
+            inserted_count = 0
 
-            inserted_count = len(response.data) if response.data else 0
+            for i in range(0, len(comments_data), chunk_size):
+                response = self.client.table('comments').upsert(
+                    comments_data[i:i + chunk_size],
+                    on_conflict='hn_id',           # Conflict column (your unique field)
+                    ignore_duplicates=True         # Skip comments already in the database
+                ).execute()
+                inserted_count += len(response.data) if response.data else 0
 
             return inserted_count
         except Exception as e:
             logger.error(f"Batch insert failed with error: {str(e)}")
             raise DatabaseError(f"Error batch creating comments: {str(e)}")
+
+    # Extraction cache operations
+    def get_cached_extractions(self, text_hashes: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Get previously extracted job data keyed by posting text hash"""
+        try:
+            if not text_hashes:
+                return {}
+
+            cached = {}
+            for i in range(0, len(text_hashes), self.IN_FILTER_CHUNK):
+                response = (
+                    self.client.table("extraction_cache")
+                    .select("text_hash, structured_data")
+                    .in_("text_hash", text_hashes[i:i + self.IN_FILTER_CHUNK])
+                    .execute()
+                )
+                cached.update({row["text_hash"]: row["structured_data"] for row in response.data or []})
+            return cached
+        except Exception as e:
+            raise DatabaseError(f"Error fetching cached extractions: {str(e)}")
+
+    def save_cached_extractions(self, extractions: Dict[str, Dict[str, Any]]) -> int:
+        """Store extracted job data keyed by posting text hash (existing hashes are kept)"""
+        try:
+            if not extractions:
+                return 0
+
+            rows = [
+                {"text_hash": text_hash, "structured_data": structured_data}
+                for text_hash, structured_data in extractions.items()
+            ]
+            response = self.client.table("extraction_cache").upsert(
+                rows,
+                on_conflict="text_hash",
+                ignore_duplicates=True
+            ).execute()
+            return len(response.data) if response.data else 0
+        except Exception as e:
+            raise DatabaseError(f"Error saving cached extractions: {str(e)}")
@@ -6,6 +6,11 @@ import logging
 from dotenv import load_dotenv
 
 from routers import stories, admin
+from database.db_layer import HNDatabase
+from services.hn_api_service import HNAPIService
+from services.cache_service import JobsCache
+from services.cron_service import HNCronService
+from services.processing_service import ClaudeProcessingService
 
 load_dotenv()
 
@@ -18,7 +23,16 @@ logging.basicConfig(
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Using Supabase - tables managed via Supabase dashboard/migrations
-    yield
+    # Create shared services once so their clients are reused across requests
+    # One HN API client for the process lifetime - closed on shutdown or failed startup
+    async with HNAPIService.create_client() as hn_client:
+        app.state.db = HNDatabase()
+        app.state.jobs_cache = JobsCache(app.state.db)
+        app.state.cron_service = HNCronService(hn_api=HNAPIService(client=hn_client), database=app.state.db,
+                                               jobs_cache=app.state.jobs_cache)
+        app.state.processing_service = ClaudeProcessingService(database=app.state.db,
+                                                               jobs_cache=app.state.jobs_cache)
+        yield
 
 app = FastAPI(
     title="HN Newsletter API",
@@ -51,4 +65,4 @@ async def health_check():
     return {"status": "healthy"}
 
 if __name__ == "__main__":
-    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
+    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True, loop="uvloop")
\ No newline at end of file
@@ -111,8 +111,8 @@ class DatabaseCommentData(BaseModel):
 
     @classmethod
     def from_hn_comment(cls, hn_comment: 'HNCommentResponse', story_db_id: int) -> 'DatabaseCommentData':
-        """Convert HN API response to database format"""
-        return cls(
+        """Convert HN API response to database format (already validated, so skip revalidation)"""
+        return cls.model_construct(
             hn_id=hn_comment.id,
             story_id=story_db_id,
             story_text=hn_comment.text,
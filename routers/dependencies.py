@@ -0,0 +1,20 @@
+from fastapi import Request
+
+from database.db_layer import HNDatabase
+from services.cache_service import JobsCache
+from services.cron_service import HNCronService
+from services.processing_service import ClaudeProcessingService
+
+
+# Shared instances are created once in main.py's lifespan and stored on app.state
+def get_db(request: Request) -> HNDatabase:
+    return request.app.state.db
+
+def get_jobs_cache(request: Request) -> JobsCache:
+    return request.app.state.jobs_cache
+
+def get_cron_service(request: Request) -> HNCronService:
+    return request.app.state.cron_service
+
+def get_processing_service(request: Request) -> ClaudeProcessingService:
+    return request.app.state.processing_service
@@ -1,14 +1,37 @@
-from fastapi import APIRouter, HTTPException
-from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
+from collections import deque
+import orjson
+import time
+from typing import List, Optional, Tuple
 from datetime import datetime, timedelta
 from pydantic import BaseModel
 
-from database.db_layer import HNDatabase
+from routers.dependencies import get_cron_service, get_jobs_cache, get_processing_service
+from services.cache_service import JobsCache
+from services.cron_service import HNCronService
+from services.processing_service import ClaudeProcessingService
 from utils.months import Month
 
 
 router = APIRouter()
 
+# "september" -> "09", built once at import
+_MONTH_LOOKUP = {m.name.lower(): m.value for m in Month}
+
+# (expires_at, year, "YYYY-MM") for the current month, refreshed once a minute
+_current_month_cache: Tuple[float, int, str] = (0.0, 0, "")
+
+def _current_year_month() -> Tuple[int, str]:
+    """Return the current year and "YYYY-MM" month, recomputed at most once per minute"""
+    global _current_month_cache
+    expires_at, year, month = _current_month_cache
+    if time.monotonic() >= expires_at:
+        now = datetime.now()
+        year, month = now.year, f"{now.year}-{now.month:02d}"  # Format as "2025-09"
+        _current_month_cache = (time.monotonic() + 60, year, month)
+    return year, month
+
 class StoryResponse(BaseModel):
     id: int
     hn_id: int
@@ -26,22 +49,16 @@ class StoryResponse(BaseModel):
         from_attributes = True
 
 @router.post("/process-hiring-thread/{story_id}")
-async def test_process_hiring_thread(story_id: int):
+async def test_process_hiring_thread(story_id: int, cron_service: HNCronService = Depends(get_cron_service)):
     """Test endpoint to run the complete cron workflow"""
-    from services.cron_service import HNCronService
-
-    cron_service = HNCronService()
-
     try:
         result = await cron_service.process_hiring_thread(story_id)
-        await cron_service.close()  # Clean up resources
         return {
             "success": True,
             "message": f"Processed hiring thread {story_id}",
             "data": result
         }
     except Exception as e:
-        await cron_service.close()
         return {
             "success": False,
             "error": str(e),
@@ -54,31 +71,27 @@ async def test_process_hiring_thread(story_id: int):
 
 
 @router.get("/jobs")
-async def get_jobs(month: Optional[str] = None):
-    database = HNDatabase()
-
+async def get_jobs(month: Optional[str] = None, jobs_cache: JobsCache = Depends(get_jobs_cache)):
     try:
-        current_year = datetime.now().year
+        current_year, current_month = _current_year_month()
 
         # If no month provided, default to current month
         if not month:
-            current_month = datetime.now().month
-            month = f"{current_year}-{current_month:02d}"  # Format as "2025-09"
+            month = current_month
 
         # If month is a name (like "september"), convert it
         elif "-" not in month:
-            try:
-                month_enum = Month[month.upper()]  # "september" -> Month.SEPTEMBER
-                month = f"{current_year}-{month_enum.value}"  # -> "2025-09"
-            except KeyError:
+            month_number = _MONTH_LOOKUP.get(month.lower())  # "september" -> "09"
+            if month_number is None:
                 return {
                     "success": False,
                     "error": f"Invalid month name: {month}"
                 }
+            month = f"{current_year}-{month_number}"  # -> "2025-09"
 
         # Otherwise, month is already in "2025-09" format, use as-is
 
-        jobs = database.get_completed_jobs(month)
+        jobs = await jobs_cache.get_completed_jobs(month)
 
         return {
             "success": True,
@@ -119,15 +132,23 @@ async def get_comments(story_id: int):
     # comments = db.query(Comment).filter(Comment.story_hn_id == story_id).all()
     # return comments
 
+# Handlers calling the synchronous Supabase/Anthropic clients are plain `def`
+# so FastAPI runs them in its threadpool instead of blocking the event loop
 @router.post("/process-comments")
-async def process_pending_comments():
+def process_pending_comments(stream: bool = False,
+                             processing_service: ClaudeProcessingService = Depends(get_processing_service)):
     """Dedicated endpoint for Claude processing of all pending comments"""
-    from services.processing_service import ClaudeProcessingService
+    records = processing_service.process_pending_comments()
 
-    processing_service = ClaudeProcessingService()
+    # ?stream=true - one JSON line per comment as it finishes, then the summary
+    if stream:
+        return StreamingResponse(
+            (orjson.dumps(record) + b"\n" for record in records),
+            media_type="application/x-ndjson"
+        )
 
     try:
-        result = processing_service.process_pending_comments()
+        result = deque(records, maxlen=1).pop()["summary"]  # Only keep the final summary
         return {
             "success": True,
             "message": f"Processed all pending comments with Claude",
@@ -140,12 +161,8 @@ async def process_pending_comments():
         }
 
 @router.post("/process-comment/{hn_id}")
-async def process_single_comment(hn_id: int):
+def process_single_comment(hn_id: int, processing_service: ClaudeProcessingService = Depends(get_processing_service)):
     """Process a specific comment by HN ID"""
-    from services.processing_service import ClaudeProcessingService
-
-    processing_service = ClaudeProcessingService()
-
     try:
         result = processing_service.process_single_comment(hn_id)
 
@@ -0,0 +1,86 @@
+import asyncio
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Tuple
+
+from database.db_layer import HNDatabase
+
+logger = logging.getLogger(__name__)
+
+
+class JobsCache:
+    """In-process LRU + TTL cache for completed jobs, keyed on month"""
+
+    def __init__(self, database: HNDatabase, ttl: float = 300, max_entries: int = 32):
+        self.database = database
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, List[Dict[str, Any]]]]" = OrderedDict()
+        # invalidate() is called from threadpool threads, so the dict gets a thread lock
+        self._lock = threading.Lock()
+        # Bumped on every invalidate so a miss that started before it isn't stored
+        self._generation = 0
+        # One lock per month being fetched - stops a stampede without serialising other months
+        self._fetch_locks: Dict[str, asyncio.Lock] = {}
+
+    def _get_fresh(self, month: str) -> Optional[List[Dict[str, Any]]]:
+        """Return the cached jobs for a month if present and unexpired"""
+        with self._lock:
+            entry = self._entries.get(month)
+            if entry and time.monotonic() < entry[0]:
+                self._entries.move_to_end(month)
+                return entry[1]
+            return None
+
+    async def get_completed_jobs(self, month: str) -> List[Dict[str, Any]]:
+        """
+        Return completed jobs for a month, hitting Supabase only on a miss
+
+        Args:
+            month: Month in YYYY-MM format
+
+        Returns:
+            List of completed comment records
+        """
+        jobs = self._get_fresh(month)
+        if jobs is not None:
+            return jobs
+
+        fetch_lock = self._fetch_locks.setdefault(month, asyncio.Lock())
+        try:
+            async with fetch_lock:
+                # Another request may have filled the entry while we waited
+                jobs = self._get_fresh(month)
+                if jobs is not None:
+                    return jobs
+
+                with self._lock:
+                    generation = self._generation
+
+                # Miss or expired - the sync client runs off the event loop
+                jobs = await asyncio.to_thread(self.database.get_completed_jobs, month)
+
+                with self._lock:
+                    if generation == self._generation:
+                        self._entries[month] = (time.monotonic() + self.ttl, jobs)
+                        self._entries.move_to_end(month)
+                        if len(self._entries) > self.max_entries:
+                            self._entries.popitem(last=False)  # Evict least recently used
+
+                return jobs
+        finally:
+            # Months come from the query string, so don't keep a lock around per value
+            if not fetch_lock.locked() and self._fetch_locks.get(month) is fetch_lock:
+                del self._fetch_locks[month]
+
+    def invalidate(self, month: Optional[str] = None):
+        """Drop the cached entry for a month, or everything if no month given"""
+        with self._lock:
+            self._generation += 1
+            if month is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(month, None)
+        logger.info(f"Invalidated jobs cache for {month or 'all months'}")
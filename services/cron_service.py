@@ -1,3 +1,4 @@
+import asyncio
 import logging
 from datetime import datetime
 from typing import List, Dict, Any, Optional
@@ -5,6 +6,7 @@ from typing import List, Dict, Any, Optional
 from pydantic import ValidationError
 from services.hn_api_service import HNAPIService, HNAPIError
 from database.db_layer import HNDatabase, DatabaseError
+from services.cache_service import JobsCache
 from models.hn_models import DatabaseCommentData, DatabaseStoryData, HNCommentResponse, HNStoryResponse
 from datetime import datetime
 
@@ -19,9 +21,11 @@ class CronServiceError(Exception):
 class HNCronService:
     """Cron service for fetching and processing HN data"""
 
-    def __init__(self):
-        self.hn_api = HNAPIService()
-        self.database = HNDatabase()
+    def __init__(self, hn_api: Optional[HNAPIService] = None, database: Optional[HNDatabase] = None,
+                 jobs_cache: Optional[JobsCache] = None):
+        self.hn_api = hn_api or HNAPIService()
+        self.database = database or HNDatabase()
+        self.jobs_cache = jobs_cache
 
     async def process_hiring_thread(self, story_id: int) -> Dict[str, Any]:
         """
@@ -51,27 +55,30 @@ class HNCronService:
             logger.info(f'Database payload: {db_story_data.model_dump()}')
 
             # Save story to database (with duplicate prevention)
-            saved_story = self.database.create_story(**db_story_data.model_dump())
+            # The Supabase client is synchronous - run it off the event loop
+            saved_story = await asyncio.to_thread(self.database.create_story, **db_story_data.model_dump())
             story_db_id = saved_story['id']  # Need this for comment foreign keys
 
             # logger.info(f"Fetching the id {hn_story.kids}")
 
             # Fetch and process all job posting comments
             # kids array contains HN comment IDs for job postings
-            raw_comments = await self.hn_api.fetch_comments_batch(hn_story.kids)
-
-            validated_comments = []
-            for comment in raw_comments:
-                hn_comment = HNCommentResponse(**comment)
-                db_comment = DatabaseCommentData.from_hn_comment(hn_comment, story_db_id)
-
-                validated_comments.append(db_comment.model_dump())
-
-
-            
-            saved_count = self.database.batch_create_comments(validated_comments)
+            # Each comment is validated and converted to database format as it arrives
+            validated_comments = await self.hn_api.fetch_thread_comments(
+                story_id,
+                hn_story.kids,
+                transform=lambda comment: DatabaseCommentData.from_hn_comment(
+                    HNCommentResponse.model_validate(comment), story_db_id
+                ).model_dump()
+            )
+
+            saved_count = await asyncio.to_thread(self.database.batch_create_comments, validated_comments)
             logger.info(f"Saved  comments {saved_count} to database")
 
+            # New comments for this month - drop any cached /jobs response
+            if self.jobs_cache:
+                self.jobs_cache.invalidate(db_story_data.month)
+
             # STEP 6: Return processing summary for monitoring
             return {
                 "story_id": story_id,
@@ -94,4 +101,11 @@ class HNCronService:
 
     async def close(self):
         """Clean up resources"""
-        await self.hn_api.session.aclose()
\ No newline at end of file
+        await self.hn_api.close()
+
+    async def __aenter__(self) -> 'HNCronService':
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        """Close the HN API client even if processing raised"""
+        await self.close()
\ No newline at end of file
@@ -1,7 +1,8 @@
 import asyncio
 import httpx
+import random
 import time
-from typing import Dict, List, Optional, Any
+from typing import Callable, Dict, List, Optional, Any
 from datetime import datetime
 import logging
 
@@ -19,15 +20,59 @@ class HNAPIService:
     """Service for interacting with Hacker News API"""
 
     BASE_URL = "https://hacker-news.firebaseio.com/v0/" 
+    ALGOLIA_SEARCH_URL = "https://hn.algolia.com/api/v1/search"
+    ALGOLIA_PAGE_SIZE = 1000  # Algolia's max hitsPerPage
+    MAX_CONCURRENT_REQUESTS = 50  # Stays under Firebase's HTTP/2 stream limit
+    MAX_ATTEMPTS = 3  # Per request, for network errors and 5xx responses
 
-    def __init__(self, rate_limit_delay: float = 0.1):
+    def __init__(self, rate_limit_delay: float = 0.1, client: Optional[httpx.AsyncClient] = None):
           self.rate_limit_delay = rate_limit_delay
-          self.session = httpx.AsyncClient(
-              base_url=self.BASE_URL,
-              timeout=10.0,
-              limits=httpx.Limits(max_connections=10)  # Connection pooling
-          )
- 
+          # A shared client (created once in main.py's lifespan) is closed by its owner
+          self._owns_session = client is None
+          self.session = client or self.create_client()
+          # Caps in-flight comment requests (concurrent HTTP/2 streams)
+          self._sem = asyncio.Semaphore(self.MAX_CONCURRENT_REQUESTS)
+
+    @classmethod
+    def create_client(cls) -> httpx.AsyncClient:
+        """Build the HTTP client used for HN API requests"""
+        return httpx.AsyncClient(
+            base_url=cls.BASE_URL,
+            http2=True,  # Multiplex all requests over one connection per host
+            timeout=10.0,
+            limits=httpx.Limits(max_connections=2, max_keepalive_connections=2)  # Firebase + Algolia
+        )
+
+    async def close(self):
+        """Close the HTTP client if this service created it"""
+        if self._owns_session:
+            await self.session.aclose()
+
+    async def _get_with_retry(self, path: str, params: Optional[Dict[str, Any]] = None) -> httpx.Response:
+        """
+        GET with jittered exponential backoff on transient failures
+
+        Only network errors and 5xx responses are retried - 404s and other
+        client errors are returned to the caller as-is.
+        """
+        for attempt in range(1, self.MAX_ATTEMPTS + 1):
+            try:
+                # Rate limiting - the semaphore bounds concurrent requests to HN API
+                async with self._sem:
+                    response = await self.session.get(path, params=params)
+
+                if response.status_code >= 500:
+                    response.raise_for_status()
+                return response
+
+            except (httpx.TransportError, httpx.HTTPStatusError) as e:
+                if attempt == self.MAX_ATTEMPTS:
+                    raise
+
+                delay = min(0.2 * 2 ** (attempt - 1), 2.0) + random.uniform(0, 0.1)
+                logger.warning(f"Request {path} failed ({str(e)}), retry {attempt} in {delay:.2f}s")
+                await asyncio.sleep(delay)  # Backoff outside the semaphore
+
     async def fetch_story(self, story_id: int) -> Dict[str, Any]:
         """
         Fetch story details from HN API
@@ -43,7 +88,7 @@ class HNAPIService:
             await asyncio.sleep(self.rate_limit_delay)
 
             # Reuse the session!
-            response = await self.session.get(f"/item/{story_id}.json")
+            response = await self._get_with_retry(f"/item/{story_id}.json")
 
             if response.status_code == 404:
               raise HNAPIError(f"Story {story_id} not found or deleted")
@@ -51,7 +96,7 @@ class HNAPIService:
             response.raise_for_status()
             data = response.json()
             return data if data else None
-        except httpx.RequestError as e:
+        except (httpx.RequestError, httpx.HTTPStatusError) as e:
             raise HNAPIError(f"API request failed: {str(e)}")
 
 
@@ -67,10 +112,7 @@ class HNAPIService:
             Comment data or None if deleted/not found
         """
         try:
-            # Rate limiting - be respectful to HN API
-            await asyncio.sleep(self.rate_limit_delay)
-
-            response = await self.session.get(f"/item/{comment_id}.json")
+            response = await self._get_with_retry(f"/item/{comment_id}.json")
 
             if response.status_code == 404:
               raise HNAPIError(f"Comment {comment_id} not found or deleted")
@@ -79,47 +121,146 @@ class HNAPIService:
             data = response.json()
             return data if data else None
 
-        except httpx.RequestError as e:
+        except (httpx.RequestError, httpx.HTTPStatusError) as e:
             raise HNAPIError(f"API request failed: {str(e)}")
 
-    async def fetch_comments_batch(self, comment_ids: List[int]) -> List[Dict[str, Any]]:
+    async def _fetch_valid_comment(self, comment_id: int,
+                                   transform: Optional[Callable[[Dict[str, Any]], Dict[str, Any]]] = None
+                                   ) -> Optional[Dict[str, Any]]:
+        """Fetch one comment and apply transform, returning None if it should be skipped"""
+        try:
+            raw_valid_comment = await self.fetch_comment(comment_id)
+            if not raw_valid_comment:
+                return None  # Skip deleted/missing comments
+
+            # Skip comments that are marked as deleted
+            if raw_valid_comment.get("deleted") is True:
+                return None
+
+            return transform(raw_valid_comment) if transform else raw_valid_comment
+
+        except ValidationError as e:
+            logger.warning(f"Invalid comment {comment_id}: {str(e)}")
+            return None
+        except HNAPIError as e:
+            logger.warning(f"Failed to fetch comment {comment_id}: {str(e)}")
+            return None
+
+    async def fetch_comments_batch(self, comment_ids: List[int],
+                                   transform: Optional[Callable[[Dict[str, Any]], Dict[str, Any]]] = None
+                                   ) -> List[Dict[str, Any]]:
         """
         Fetch multiple comments with validation and transformation
 
         Args:
             comment_ids: List of HN comment IDs
-            story_db_id: Database ID of the parent story (for foreign key)
+            transform: Optional validation/transformation applied to each comment as it
+                arrives (e.g. to database format); raising ValidationError skips the comment
 
         Returns:
             List of database-ready comment dictionaries (excludes invalid/deleted comments)
         """
         valid_comments = []
 
-        for i, comment_id in enumerate(comment_ids):
+        # Transform each comment as soon as its response arrives, while others are in flight
+        pending = [self._fetch_valid_comment(comment_id, transform) for comment_id in comment_ids]
+        for i, next_comment in enumerate(asyncio.as_completed(pending)):
+            comment = await next_comment
+            if comment is not None:
+                valid_comments.append(comment)
 
-            try:
-                # Fetch raw comment from HN API
-                raw_valid_comment = await self.fetch_comment(comment_id)
-                if not raw_valid_comment:
-                    continue  # Skip deleted/missing comments
-                
-                # Skip comments that are marked as deleted
-                if raw_valid_comment.get("deleted") is True:
-                    continue
-                
-                valid_comments.append(raw_valid_comment)
-
-                # Progressf logging every 10 comments
-                if (i + 1) % 10 == 0:
-                    logger.info(f"Processed {i + 1}/{len(comment_ids)} comments")
+            # Progress logging every 100 comments
+            if (i + 1) % 100 == 0:
+                logger.info(f"Processed {i + 1}/{len(comment_ids)} comments")
+
+        logger.info(f"Successfully processed {len(valid_comments)}/{len(comment_ids)} comments")
+        return valid_comments
+
+    async def fetch_thread_comments_algolia(self, story_id: int) -> List[Dict[str, Any]]:
+        """
+        Fetch every comment in a thread from the Algolia HN search API
+
+        Args:
+            story_id: HN story ID
 
+        Returns:
+            Comments normalized to the HN API item shape (includes nested replies)
+        """
+        comments = []
+        page = 0
+
+        try:
+            while True:
+                response = await self._get_with_retry(self.ALGOLIA_SEARCH_URL, params={
+                    "tags": f"comment,story_{story_id}",
+                    "hitsPerPage": self.ALGOLIA_PAGE_SIZE,
+                    "page": page
+                })
+                response.raise_for_status()
+                data = response.json()
+
+                for hit in data.get("hits", []):
+                    comments.append({
+                        "id": int(hit["objectID"]),
+                        "type": "comment",
+                        "time": hit.get("created_at_i"),
+                        "text": hit.get("comment_text"),
+                        "by": hit.get("author"),
+                        "parent": hit.get("parent_id")
+                    })
+
+                page += 1
+                if page >= data.get("nbPages", 0):
+                    break
+
+        except (httpx.RequestError, httpx.HTTPStatusError, KeyError, ValueError) as e:
+            raise HNAPIError(f"Algolia request failed: {str(e)}")
+
+        logger.info(f"Fetched {len(comments)} comments for thread {story_id} from Algolia in {page} page(s)")
+        return comments
+
+    async def fetch_thread_comments(self, story_id: int, comment_ids: List[int],
+                                    transform: Optional[Callable[[Dict[str, Any]], Dict[str, Any]]] = None
+                                    ) -> List[Dict[str, Any]]:
+        """
+        Fetch a thread's top-level comments, preferring a bulk Algolia fetch
+
+        Any of comment_ids that Algolia doesn't return (indexing lag, result caps,
+        or Algolia being unavailable) are fetched one by one from the HN API.
+
+        Args:
+            story_id: HN story ID
+            comment_ids: Top-level comment IDs (the story's kids)
+            transform: Optional validation/transformation applied to each comment
+
+        Returns:
+            List of database-ready comment dictionaries (excludes invalid/deleted comments)
+        """
+        wanted_ids = set(comment_ids)
+
+        try:
+            algolia_comments = await self.fetch_thread_comments_algolia(story_id)
+        except HNAPIError as e:
+            logger.warning(f"Falling back to per-comment fetches for thread {story_id}: {str(e)}")
+            algolia_comments = []
+
+        valid_comments = []
+        found_ids = set()
+
+        for raw_comment in algolia_comments:
+            if raw_comment["id"] not in wanted_ids:
+                continue  # Nested reply, not a job posting
+
+            try:
+                valid_comments.append(transform(raw_comment) if transform else raw_comment)
+                found_ids.add(raw_comment["id"])
             except ValidationError as e:
-                logger.warning(f"Invalid comment {comment_id}: {str(e)}")
-                continue
-            except HNAPIError as e:
-                logger.warning(f"Failed to fetch comment {comment_id}: {str(e)}")
-                continue
+                # Left in missing_ids so the HN API copy gets a chance
+                logger.warning(f"Invalid Algolia comment {raw_comment['id']}: {str(e)}")
+
+        missing_ids = [comment_id for comment_id in comment_ids if comment_id not in found_ids]
+        if missing_ids:
+            logger.info(f"Fetching {len(missing_ids)} comments missing from Algolia via HN API")
+            valid_comments.extend(await self.fetch_comments_batch(missing_ids, transform=transform))
 
-        logger.info(f"Successfully processed {len(valid_comments)}/{len(comment_ids)} comments")
         return valid_comments
-        
\ No newline at end of file
@@ -1,16 +1,24 @@
+import hashlib
 import logging
 import re
-from typing import List, Dict, Any, Optional
-from anthropic import Anthropic
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, as_completed, wait
+from itertools import islice
+from typing import Callable, List, Dict, Any, Iterable, Iterator, Optional
+from anthropic import Anthropic, DefaultHttpxClient
 from pydantic import BaseModel, ValidationError
-import json
+import orjson
 import os
 from models.hn_models import OpenAIProcessData
 
-from database.db_layer import HNDatabase, DatabaseError
+from database.db_layer import HNDatabase, DatabaseError, PartialUpdateError
+from services.cache_service import JobsCache
 
 logger = logging.getLogger(__name__)
 
+# Built once at import - validates Claude output dicts without the **kwargs splat
+_JOB_VALIDATOR = OpenAIProcessData.__pydantic_validator__
+
 
 class ProcessingServiceError(Exception):
     """Custom exception for processing service operations"""
@@ -20,6 +28,36 @@ class ProcessingServiceError(Exception):
 class ClaudeProcessingService:
     """Service for processing job postings with OpenAI"""
 
+    MAX_WORKERS = 16  # Concurrent Claude requests - kept within Anthropic rate limits
+    BATCH_SIZE = 5  # Postings sent to Claude per request
+    UPDATE_FLUSH_SIZE = 100  # Buffered comment updates written per bulk DB call
+
+    # Output budgets sized to the expected JSON (~200-400 tokens per posting)
+    MAX_TOKENS_PER_POSTING = 512
+    MAX_BATCH_TOKENS = 2048
+    STOP_SEQUENCES = ["\n\n\n"]  # Cut off explanatory text after the JSON
+
+    # Basic HTML entities HN uses in comment text, replaced in a single regex pass
+    _ENTITY_MAP = {
+        '&#x2F;': '/',
+        '&amp;': '&',
+        '&quot;': '"',
+        '&#x27;': "'",
+        '&lt;': '<',
+        '&gt;': '>'
+    }
+    _ENTITY_RE = re.compile('|'.join(re.escape(entity) for entity in _ENTITY_MAP))
+
+    # Cheap pre-filter - 'skipped' is final, so only drop replies that have no job
+    # keyword at all or are one-liners ("Thanks!", "+1") once tags are stripped
+    MIN_POSTING_LENGTH = 40
+    _TAG_RE = re.compile(r'<[^>]+>')
+    _JOB_KEYWORDS_RE = re.compile(
+        r'\b(hiring|remote|onsite|stack|salary|apply|engineer|developer|role|position|'
+        r'internship|contract(?:or)?|full[- ]time|visa)s?\b',
+        re.IGNORECASE
+    )
+
     prompt = """You are an expert at extracting job posting information from Hacker News "Who is hiring" posts.
 
         EXTRACTION RULES:
@@ -43,90 +81,262 @@ class ClaudeProcessingService:
         Return your response as a valid JSON object with these fields.
         """
 
-    def __init__(self):
-        """Initialize OpenAI client and database connection"""
-        self.database = HNDatabase()
+    # Narrow prompts for single-posting extraction - run in parallel and merged
+    PROMPT_IDENTITY = """You are an expert at extracting job posting information from Hacker News "Who is hiring" posts.
+
+        EXTRACTION RULES:
+        - company: Company or organization name (required)
+        - description: Description of what they do (required)
+        - location: City, state, country, or "Remote" if mentioned
+
+        Return your response as a valid JSON object with only these fields.
+        """
+
+    PROMPT_ROLES = """You are an expert at extracting job posting information from Hacker News "Who is hiring" posts.
+
+        EXTRACTION RULES:
+        - positions: All job titles mentioned (required - at least one)
+        - stack: All technologies, programming languages, frameworks mentioned
+        - employment_type: Full-time, Part-time, Contract, Internship if mentioned
+        - remote_friendly: true if remote work is explicitly supported
+
+        IMPORTANT:
+        - Be thorough with technology stack extraction
+
+        Return your response as a valid JSON object with only these fields.
+        """
+
+    PROMPT_CONTACT = """You are an expert at extracting job posting information from Hacker News "Who is hiring" posts.
 
-        self.client = Anthropic(api_key=os.getenv("CLAUDE_API_KEY"))
+        EXTRACTION RULES:
+        - email: Contact email (convert "john at company dot com" to "john@company.com")
+        - application_url: Any URLs for applying or company careers pages
+        - salary: Any compensation/salary information
+
+        IMPORTANT:
+        - Convert common email obfuscations: "at"→"@", "dot"→".", "[at]"→"@"
+        - Look for both direct emails and application URLs
+
+        Return your response as a valid JSON object with only these fields.
+        """
+
+    batch_prompt = """Several job postings follow, each starting with a ===POSTING N=== marker.
+        Return a JSON array with one object per posting, in order. Add a "posting" field
+        to each object holding its posting number N.
+        """
+
+    def __init__(self, database: Optional[HNDatabase] = None, jobs_cache: Optional[JobsCache] = None):
+        """Initialize OpenAI client and database connection"""
+        self.database = database or HNDatabase()
+        self.jobs_cache = jobs_cache
+
+        # HTTP/2 lets the worker threads multiplex requests over a reused connection.
+        # DefaultHttpxClient is built on the httpx package the installed SDK expects
+        # and keeps its pool defaults - MAX_WORKERS bounds the concurrent requests
+        self.client = Anthropic(
+            api_key=os.getenv("CLAUDE_API_KEY"),
+            timeout=60.0,
+            http_client=DefaultHttpxClient(http2=True)
+        )
+
+        # Static instructions go in the system prompt, marked for Anthropic prompt caching
+        self.sub_system_prompts = [
+            [{"type": "text", "text": prompt, "cache_control": {"type": "ephemeral"}}]
+            for prompt in (self.PROMPT_IDENTITY, self.PROMPT_ROLES, self.PROMPT_CONTACT)
+        ]
+        self.batch_system_prompt = [
+            {"type": "text", "text": self.prompt},
+            {"type": "text", "text": self.batch_prompt, "cache_control": {"type": "ephemeral"}}
+        ]
+
+        # Runs the parallel sub-extractions for single postings
+        self._sub_executor = ThreadPoolExecutor(max_workers=self.MAX_WORKERS, thread_name_prefix="claude-extract")
     
 
-    def process_pending_comments(self) -> Dict[str, Any]:
+    def process_pending_comments(self) -> Iterator[Dict[str, Any]]:
         """
         Main method: Process all pending comments with Claude
 
-        Returns:
-            Summary of processing results
+        Yields:
+            {"hn_id", "status", "error"} for each comment once its result is written,
+            then a final {"summary": {...}} record with the processing totals
         """
         logger.info("Starting processing of all pending comments")
 
-        pending_comments = self.database.get_pending_comments()
-
-        logger.info(f"Pending comments are {len(pending_comments)}")
+        # Streamed from the DB - Claude calls start before the scan finishes
+        pending_comments = self.database.iter_pending_comments(columns=("hn_id", "story_text"))
 
         processed_count = 0;
-        successful_count = 0;
-        failed_count = 0;
-        errors = []
-
-        for comment in pending_comments:
-            logger.info(f'Processing id is {comment} here')
-            try :
-                cleaned_comment = self._clean_html_text(comment["story_text"])
-                structured_data = self._extract_job_data_with_claude(cleaned_comment)
-
-                if structured_data is None:
-                    value = self._update_comment_with_results(comment["hn_id"], None, "error")
-                    failed_count += 1
-                else:
-                    value = self._update_comment_with_results(comment["hn_id"], structured_data, "completed")
-                    if value:
-                        successful_count += 1
-                    else:
-                        failed_count += 1
-                logger.info(f"data extracted by llm {json.dumps(structured_data, indent=4, sort_keys=True)}") 
-            except Exception as e:
-                logger.info(f"Any exception {e}")
-                errors.append(e)
-        results = {
-            "processed_count": processed_count,
-            "successful_count": successful_count,
-            "failed_count": failed_count,
-            "errors": errors
+        status_counts = Counter()  # Persisted statuses: completed / error / skipped / failed
+        errors: List[str] = []  # Messages only - no exception/traceback objects held for the run
+        updates: List[Dict[str, Any]] = []  # Local buffer - the service instance is shared across requests
+
+        # Claude calls are independent network I/O - run them concurrently
+        with ThreadPoolExecutor(max_workers=self.MAX_WORKERS) as executor:
+            for future in self._completed_batches(executor, pending_comments):
+                try :
+                    batch_updates = future.result()
+                    processed_count += len(batch_updates)
+                    updates.extend(batch_updates)
+                except Exception as e:
+                    logger.info(f"Any exception {e}")
+                    errors.append(str(e))
+                    continue
+
+                if len(updates) >= self.UPDATE_FLUSH_SIZE:
+                    yield from self._flush_updates(updates, status_counts, errors)
+
+        yield from self._flush_updates(updates, status_counts, errors)
+        successful_count = status_counts["completed"]
+        failed_count = status_counts["error"] + status_counts["failed"]
+
+        # Comments moved to completed - cached /jobs responses are stale
+        if self.jobs_cache and successful_count:
+            self.jobs_cache.invalidate()
+
+        yield {
+            "summary": {
+                "processed_count": processed_count,
+                "successful_count": successful_count,
+                "failed_count": failed_count,
+                "skipped_count": status_counts["skipped"],
+                "errors": errors
+            }
         }
 
+    @staticmethod
+    def _batched(items: Iterable[Dict[str, Any]], size: int) -> Iterator[List[Dict[str, Any]]]:
+        """Split an iterable into lists of at most size items"""
+        iterator = iter(items)
+        while batch := list(islice(iterator, size)):
+            yield batch
+
+    def _completed_batches(self, executor: ThreadPoolExecutor,
+                           comments: Iterable[Dict[str, Any]]) -> Iterator[Future]:
+        """Submit comments in batches and yield their futures as they finish"""
+        in_flight = set()
+
+        # Several postings share each Claude request to amortize the prompt
+        for batch in self._batched(comments, self.BATCH_SIZE):
+            in_flight.add(executor.submit(self._process_batch, batch))
+
+            # Bounded window - don't pull the whole backlog into memory ahead of Claude
+            if len(in_flight) >= self.MAX_WORKERS * 2:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                yield from done
+
+        yield from as_completed(in_flight)
+
+    def _process_batch(self, comments: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Clean and extract a batch of comments with one Claude call - safe to run in a worker thread
+
+        Returns:
+            Comment updates ({"hn_id", "status", "structured_data"}) ready for the bulk flush
+        """
+        updates = []
+        postings = []  # (hn_id, cleaned text) sent to Claude
+
+        for comment in comments:
+            logger.debug("Processing id is %s here", comment)
+            cleaned_comment = self._clean_html_text(comment["story_text"] or "")
+
+            if not self._looks_like_job_posting(cleaned_comment):
+                updates.append({"hn_id": comment["hn_id"], "status": "skipped", "structured_data": None})
+                continue
+            postings.append((comment["hn_id"], cleaned_comment))
+
+        if postings:
+            structured_results = self._extract_with_cache(
+                [text for _, text in postings], self._extract_job_data_batch
+            )
+            for (hn_id, _), structured_data in zip(postings, structured_results):
+                status = "error" if structured_data is None else "completed"
+                updates.append({"hn_id": hn_id, "status": status, "structured_data": structured_data})
+                logger.debug("data extracted by llm %s", structured_data)  # Formatted only if DEBUG is on
+
+        return updates
+
+    @staticmethod
+    def _text_hash(cleaned_text: str) -> str:
+        """Content address for a posting - blake2b is fast and plenty for collision avoidance"""
+        return hashlib.blake2b(cleaned_text.encode(), digest_size=16).hexdigest()
+
+    def _extract_with_cache(self, cleaned_texts: List[str],
+                            extract: Callable[[List[str]], List[Optional[Dict[str, Any]]]]
+                            ) -> List[Optional[Dict[str, Any]]]:
+        """
+        Reuse cached extractions for previously seen posting text, calling extract for the rest
+
+        Cache lookups and writes are best effort - a cache failure only costs a Claude call.
+        """
+        text_hashes = [self._text_hash(text) for text in cleaned_texts]
+
+        try:
+            cached = self.database.get_cached_extractions(list(set(text_hashes)))
+        except DatabaseError as e:
+            logger.warning(f"Extraction cache lookup failed: {str(e)}")
+            cached = {}
+
+        results = [cached.get(text_hash) for text_hash in text_hashes]
+        missing = [i for i, data in enumerate(results) if data is None]
+        if not missing:
+            return results
+
+        extracted = extract([cleaned_texts[i] for i in missing])
+        new_entries = {}
+        for i, structured_data in zip(missing, extracted):
+            results[i] = structured_data
+            if structured_data is not None:
+                new_entries[text_hashes[i]] = structured_data
+
+        try:
+            self.database.save_cached_extractions(new_entries)
+        except DatabaseError as e:
+            logger.warning(f"Extraction cache write failed: {str(e)}")
+
         return results
 
+    def _looks_like_job_posting(self, text: str) -> bool:
+        """Reject obvious non-job replies before spending a Claude call"""
+        if self._JOB_KEYWORDS_RE.search(text) is None:
+            return False
+        # Length is measured on visible text - markup shouldn't let a one-liner through
+        return len(self._TAG_RE.sub("", text)) >= self.MIN_POSTING_LENGTH
+
     def process_single_comment(self, hn_id: int) -> Dict[str, Any]:
         logger.info(f"=== Starting single comment processing for HN ID: {hn_id} ===")
 
         try:
             # Step 1: Get comment from database
-            logger.info(f"Step 1: Fetching comment with HN ID {hn_id}")
-            comments = self.database.get_comments_by_hn_id(hn_id)
-            logger.info(f"Retrieved comments: {len(comments)} found")
-
-            if not comments:
+            logger.debug("Step 1: Fetching comment with HN ID %s", hn_id)
+            comment = self.database.get_comment_by_hn_id(hn_id)
+            if comment is None:
                 raise ValueError(f"No comment found with HN ID {hn_id}")
 
-            comment = comments[0]  # Get the first (should be only) comment
-            logger.info(f"Processing comment: {comment}")
+            logger.debug("Processing comment: %s", comment)
 
             # Step 2: Clean HTML text
-            logger.info(f"Step 2: Cleaning HTML text")
-            raw_text = comment["story_text"]
-            logger.info(f"Raw text (first 200 chars): {raw_text[:200]}...")
-            cleaned_comment = self._clean_html_text(raw_text)
-            logger.info(f"Cleaned text (first 200 chars): {cleaned_comment[:200]}...")
+            logger.debug("Step 2: Cleaning HTML text")
+            logger.debug("Raw text (first 200 chars): %.200s...", comment["story_text"])
+            cleaned_comment = self._clean_html_text(comment["story_text"])
+            logger.debug("Cleaned text (first 200 chars): %.200s...", cleaned_comment)
 
             # Step 3: Extract data with Claude
-            logger.info(f"Step 3: Processing with Claude")
-            structured_data = self._extract_job_data_with_claude(cleaned_comment)
-            logger.info(f"Claude extraction result: {structured_data}")
+            logger.debug("Step 3: Processing with Claude")
+            structured_data = self._extract_with_cache(
+                [cleaned_comment], lambda texts: [self._extract_job_data_with_claude(texts[0])]
+            )[0]
+            logger.debug("Claude extraction result: %s", structured_data)
 
             # Step 4: Update database
-            logger.info(f"Step 4: Updating database")
-            update_success = self._update_comment_with_results(comment["hn_id"], structured_data)
-            logger.info(f"Database update success: {update_success}")
+            logger.debug("Step 4: Updating database")
+            status = "error" if structured_data is None else "completed"
+            update_success = self._update_comment_with_results(comment["hn_id"], structured_data, status)
+            logger.debug("Database update success: %s", update_success)
+
+            if self.jobs_cache and update_success:
+                self.jobs_cache.invalidate()
 
             # Return result
             result = {
@@ -151,9 +361,12 @@ class ClaudeProcessingService:
       Minimal cleaning - let Claude handle the HTML parsing
       """
       try:
+          # Fast path - most comments have no entities, skip the regex scan entirely
+          if '&' not in raw_text:
+              return raw_text
+
           # Just handle the most basic HTML entities that might break parsing
-          cleaned = raw_text.replace('&#x2F;', '/').replace('&amp;', '&')
-          return cleaned
+          return self._ENTITY_RE.sub(lambda match: self._ENTITY_MAP[match.group(0)], raw_text)
 
       except Exception as e:
           logger.error(f"Basic cleaning failed: {e}")
@@ -210,46 +423,169 @@ class ClaudeProcessingService:
 
     def _extract_job_data_with_claude(self, cleaned_text: str) -> Dict[str, Any]:
         try:
+            # Identity, roles and contact fields are extracted by three concurrent calls
+            futures = [
+                self._sub_executor.submit(self._extract_fields_with_claude, system_prompt, cleaned_text)
+                for system_prompt in self.sub_system_prompts
+            ]
+
+            raw_data = {}
+            for future in futures:
+                raw_data.update(future.result())
+
+            # Validate the merged fields with your Pydantic model
+            validated_data = _JOB_VALIDATOR.validate_python(raw_data)
+            return validated_data.model_dump()  # DB layer reads fields (e.g. email) from the dict
+
+        except Exception as e:
+            logger.error(f"Claude processing failed: {e}")
+            return None
+
+    def _extract_fields_with_claude(self, system_prompt: List[Dict[str, Any]], cleaned_text: str) -> Dict[str, Any]:
+        """Run one narrow extraction prompt and return its JSON object"""
+        # Claude API call
+        response = self.client.messages.create(
+            model="claude-3-haiku-20240307",  # Most cost-effective
+            max_tokens=self.MAX_TOKENS_PER_POSTING,
+            stop_sequences=self.STOP_SEQUENCES,
+            system=system_prompt,
+            messages=[{
+                "role": "user",
+                "content": f"Job posting text:\n{cleaned_text}"
+            }]
+        )
+
+        # Extract JSON from Claude's response
+        raw_data = orjson.loads(response.content[0].text)
+        if not isinstance(raw_data, dict):
+            raise ValueError("Expected a JSON object")
+        return raw_data
+
+    def _extract_job_data_batch(self, cleaned_texts: List[str],
+                                max_tokens: Optional[int] = None) -> List[Optional[Dict[str, Any]]]:
+        """
+        Extract several postings in one Claude call - one result (or None) per posting
+
+        A response cut off at max_tokens isn't parsed - the batch is split in half and
+        retried, and a lone posting is retried once with the full batch budget.
+        """
+        results: List[Optional[Dict[str, Any]]] = [None] * len(cleaned_texts)
+        if max_tokens is None:
+            max_tokens = min(self.MAX_TOKENS_PER_POSTING * len(cleaned_texts), self.MAX_BATCH_TOKENS)
+
+        try:
+            postings = "\n\n".join(f"===POSTING {i}===\n{text}" for i, text in enumerate(cleaned_texts))
+
             # Claude API call
             response = self.client.messages.create(
                 model="claude-3-haiku-20240307",  # Most cost-effective
-                max_tokens=1000,
+                max_tokens=max_tokens,
+                stop_sequences=self.STOP_SEQUENCES,
+                system=self.batch_system_prompt,
                 messages=[{
                     "role": "user",
-                    "content": f"{self.prompt}\n\nJob posting text:\n{cleaned_text}"
+                    "content": postings
                 }]
             )
 
-            # Extract JSON from Claude's response
-            content = response.content[0].text
-            raw_data = json.loads(content)
-
-            # Validate with your Pydantic model
-            validated_data = OpenAIProcessData(**raw_data)
-            return validated_data.model_dump()
+            truncated = response.stop_reason == "max_tokens"
+            if not truncated:
+                # Extract JSON array from Claude's response
+                content = response.content[0].text
+                raw_items = orjson.loads(content)
+                if not isinstance(raw_items, list):
+                    raise ValueError("Expected a JSON array of postings")
 
         except Exception as e:
-            logger.error(f"Claude processing failed: {e}")
-            return None
+            logger.error(f"Claude batch processing failed: {e}")
+            return results
+
+        if truncated:
+            return self._retry_truncated_batch(cleaned_texts, max_tokens)
+
+        # Claude may leave unusable postings out of the array, so array order only
+        # identifies a posting when every posting came back
+        positional = len(raw_items) == len(cleaned_texts)
+
+        for position, raw_data in enumerate(raw_items):
+            if not isinstance(raw_data, dict):
+                continue
+            index = raw_data.get("posting")
+            if index is None and positional:
+                index = position
+            # bool is an int subclass - "posting": true isn't a posting number
+            if type(index) is not int or not 0 <= index < len(cleaned_texts) or results[index] is not None:
+                continue  # Unmatched postings stay None
+
+            try:
+                # Validate with your Pydantic model
+                results[index] = _JOB_VALIDATOR.validate_python(raw_data).model_dump()
+            except ValidationError as e:
+                logger.error(f"Claude processing failed for posting {index}: {e}")
+
+        return results
+
+    def _retry_truncated_batch(self, cleaned_texts: List[str],
+                               max_tokens: int) -> List[Optional[Dict[str, Any]]]:
+        """Re-extract a batch whose output hit max_tokens - halves get their own budgets"""
+        if len(cleaned_texts) > 1:
+            logger.warning("Claude output for %d postings hit max_tokens - splitting the batch",
+                           len(cleaned_texts))
+            middle = len(cleaned_texts) // 2
+            return (self._extract_job_data_batch(cleaned_texts[:middle])
+                    + self._extract_job_data_batch(cleaned_texts[middle:]))
+
+        if max_tokens < self.MAX_BATCH_TOKENS:
+            return self._extract_job_data_batch(cleaned_texts, max_tokens=self.MAX_BATCH_TOKENS)
+
+        logger.error(f"Claude output for a single posting exceeded {max_tokens} tokens")
+        return [None]
+
+    def _flush_updates(self, updates: List[Dict[str, Any]], status_counts: Counter,
+                       errors: List[str]) -> List[Dict[str, Any]]:
+        """Write buffered comment updates in bulk - returns one result record per comment"""
+        if not updates:
+            return []
+
+        error = None
+        failed_hn_ids = None  # None - every row counts as failed
+        try:
+            self.database.batch_update_comment_status(updates)
+        except PartialUpdateError as e:
+            logger.error(f"Failed to update {len(e.failed_hn_ids)} of {len(updates)} comments: {str(e)}")
+            error = str(e)
+            errors.append(error)
+            failed_hn_ids = set(e.failed_hn_ids)
+        except DatabaseError as e:
+            logger.error(f"Failed to update {len(updates)} comments: {str(e)}")
+            error = str(e)
+            errors.append(error)
+
+        records = []
+        for update in updates:
+            # Only rows in a failed chunk are reported failed - the rest were written
+            failed = error is not None and (failed_hn_ids is None or update["hn_id"] in failed_hn_ids)
+            status = "failed" if failed else update["status"]
+            status_counts[status] += 1
+            records.append({"hn_id": update["hn_id"], "status": status, "error": error if failed else None})
+
+        updates.clear()
+        return records
 
-    
     def _update_comment_with_results(self, comment_id: int, structured_data: Dict[str, Any],
                                    status: str = 'completed') -> bool:
-        """Update comment with processed results"""
+        """
+        Update comment with processed results
+
+        Raises DatabaseError on failure rather than issuing a second error-marking
+        UPDATE - the comment stays pending and is picked up by the next bulk run.
+        """
         try:
             return self.database.update_comment_status(
                 comment_id=comment_id,
                 status=status,
                 structured_data=structured_data
             )
-        except (DatabaseError, Exception) as e:
+        except DatabaseError as e:
             logger.error(f"Failed to update comment {comment_id}: {str(e)}")
-            try:
-                self.database.update_comment_status(
-                    comment_id=comment_id,
-                    status="error",
-                    structured_data=None
-                )
-            except Exception:
-                logger.error(f"Failed to mark comment {comment_id} as error")
-            return False
\ No newline at end of file
+            raise
\ No newline at end of file